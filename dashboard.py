@@ -1,7 +1,12 @@
+import numpy as np
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from scipy.stats import pearsonr
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+from data import (load_co2, load_energy, load_gdp, load_temp, load_disasters,
+                  pearson, world_co2_by_year, year_join)
 
 st.set_page_config(page_title="China Climate Case Study", layout="wide")
 
@@ -28,145 +33,6 @@ GDP_XLSX    = "gdp_per_capita_yearly_growth.xlsx"           # wide by year, firs
 TEMP_CSV    = "temperature_china_cleaned.csv"               # tidy: Year + Temperature column
 DISASTER_XL = "natural_disasters.xlsx"                      # either tidy [Year, Disasters] or raw EM-DAT-like
 
-COUNTRY = "China"  # fixed per your project
-
-# =========================
-# Helpers
-# =========================
-def _melt_years(df: pd.DataFrame, id_col: str, value_name: str) -> pd.DataFrame:
-    """
-    Robust wide→long reshape:
-    - normalizes headers to strings
-    - detects year columns (1700–2100), tolerant to '1960.0'
-    - returns [id_col, Year, value_name]
-    """
-    df = df.copy()
-    df.columns = [str(c).strip() for c in df.columns]
-
-    # ensure ID column exists; fallbacks if needed
-    if id_col not in df.columns:
-        candidates = [c for c in df.columns if c.lower() in ("country", "country name", "nation")]
-        id_col = candidates[0] if candidates else df.columns[0]
-
-    def _is_year(c):
-        try:
-            y = int(float(str(c)))
-            return 1700 <= y <= 2100
-        except:
-            return False
-
-    year_cols = [c for c in df.columns if _is_year(c)]
-    if not year_cols:
-        st.error("Could not detect year columns in the file below. Inspect headers:")
-        st.write(df.head())
-        st.stop()
-
-    out = pd.melt(df, id_vars=[id_col], value_vars=year_cols,
-                  var_name="Year", value_name=value_name)
-    out["Year"] = pd.to_numeric(out["Year"], errors="coerce")
-    out = out.dropna(subset=["Year"]).astype({"Year": int}).sort_values("Year")
-    return out
-
-def _country_filter(df: pd.DataFrame, country_col: str, country_name: str) -> pd.DataFrame:
-    return df[df[country_col].astype(str).str.strip().str.lower().eq(country_name.lower())].copy()
-
-@st.cache_data
-def load_co2(path: str):
-    """
-    Load wide CO₂ (in 1000 tonnes) Excel → tidy:
-      co2_cn:  [Year, CO₂ (Mt)]
-      co2_world: [Year, CO₂_World (Mt)]
-    """
-    df = pd.read_excel(path)
-    df = df.rename(columns={df.columns[0]: "Country"})
-    long = _melt_years(df, id_col="Country", value_name="CO2_kt")
-    long["CO₂ (Mt)"] = long["CO2_kt"] / 1000.0  # 1000 tonnes → Mt
-    co2_cn = _country_filter(long, "Country", COUNTRY)[["Year", "CO₂ (Mt)"]]
-    co2_world = long.groupby("Year", as_index=False)["CO₂ (Mt)"].sum().rename(columns={"CO₂ (Mt)":"CO₂_World (Mt)"})
-    return co2_cn.reset_index(drop=True), co2_world
-
-@st.cache_data
-def load_energy(path: str):
-    """Energy wide Excel → tidy China series: [Year, Energy (kg oil-eq./capita)]"""
-    df = pd.read_excel(path)
-    if "country" in df.columns:
-        df = df.rename(columns={"country": "Country"})
-    else:
-        df = df.rename(columns={df.columns[0]: "Country"})
-    long = _melt_years(df, id_col="Country", value_name="Energy (kg oil-eq./capita)")
-    return _country_filter(long, "Country", COUNTRY)[["Year", "Energy (kg oil-eq./capita)"]]
-
-@st.cache_data
-def load_gdp(path: str):
-    """GDP per capita growth wide Excel → tidy China series: [Year, GDP Growth (%)]"""
-    df = pd.read_excel(path)
-    if "Country Name" in df.columns:
-        df = df.rename(columns={"Country Name": "Country"})
-    else:
-        df = df.rename(columns={df.columns[0]: "Country"})
-    long = _melt_years(df, id_col="Country", value_name="GDP Growth (%)")
-    return _country_filter(long, "Country", COUNTRY)[["Year", "GDP Growth (%)"]]
-
-@st.cache_data
-def load_temp(path: str):
-    """Temperature CSV → normalize to [Year, Temperature (°C)]"""
-    df = pd.read_csv(path)
-    df.columns = [c.strip() for c in df.columns]
-    if "Temp (°C)" in df.columns and "Temperature (°C)" not in df.columns:
-        df = df.rename(columns={"Temp (°C)":"Temperature (°C)"})
-    if "Value" in df.columns and "Temperature (°C)" not in df.columns:
-        df = df.rename(columns={"Value":"Temperature (°C)"})
-    if "Year" not in df.columns or "Temperature (°C)" not in df.columns:
-        st.error("Temperature CSV must have 'Year' and 'Temperature (°C)' (or 'Value').")
-        st.write("Detected columns:", df.columns.tolist())
-        st.stop()
-    df["Year"] = pd.to_numeric(df["Year"], errors="coerce")
-    df = df.dropna(subset=["Year"]).astype({"Year": int}).sort_values("Year")
-    return df[["Year", "Temperature (°C)"]]
-
-@st.cache_data
-def load_disasters(path: str):
-    """
-    Natural disasters loader (robust):
-    - If tidy: expects [Year, Disasters]
-    - If raw EM-DAT-like: expects ['Start Year','Country', 'Disaster Type', ...] and groups to yearly counts
-    Returns China series: [Year, Disasters]
-    """
-    df = pd.read_excel(path)
-    df.columns = [str(c).strip() for c in df.columns]
-
-    # Tidy case
-    if "Year" in df.columns and ("Disasters" in df.columns or "Disaster Count" in df.columns):
-        if "Disaster Count" in df.columns and "Disasters" not in df.columns:
-            df = df.rename(columns={"Disaster Count": "Disasters"})
-        out = df[["Year", "Disasters"]].copy()
-        out["Year"] = pd.to_numeric(out["Year"], errors="coerce").astype("Int64")
-        return out.dropna(subset=["Year"]).astype({"Year": int}).sort_values("Year")
-
-    # Raw EM-DAT-like case
-    # Expect 'Start Year' and 'Country'
-    year_col = None
-    for c in df.columns:
-        if c.lower().replace("_", " ") in ("start year", "year"):
-            year_col = c
-            break
-
-    if year_col is None:
-        st.error("Could not find a 'Year' or 'Start Year' column in natural_disasters.xlsx.")
-        st.write("Detected columns:", df.columns.tolist())
-        st.stop()
-
-    # Filter China, count rows per year
-    df = df.rename(columns={year_col: "Year"})
-    df["Year"] = pd.to_numeric(df["Year"], errors="coerce")
-    if "Country" in df.columns:
-        df = _country_filter(df.dropna(subset=["Year"]), "Country", COUNTRY)
-    else:
-        df = df.dropna(subset=["Year"])
-
-    out = df.groupby("Year", as_index=False).size().rename(columns={"size": "Disasters"})
-    return out.astype({"Year": int}).sort_values("Year")
-
 # =========================
 # Load data
 # =========================
@@ -176,68 +42,163 @@ gdp_cn            = load_gdp(GDP_XLSX)
 temp_cn           = load_temp(TEMP_CSV)
 disasters_cn      = load_disasters(DISASTER_XL)
 
+# Every frame passed into the cached helpers is immutable loader output or a
+# window of it, so shape + columns + Year endpoints identify it completely.
+# Hashing that is O(1); Streamlit's default DataFrame hash walks every row.
+def _frame_key(df: pd.DataFrame):
+    return (df.shape, tuple(df.columns),
+            int(df["Year"].iloc[0]) if len(df) else None,
+            int(df["Year"].iloc[-1]) if len(df) else None)
+
+_HASH_FUNCS = {pd.DataFrame: _frame_key}
+
 # =========================
 # Year range slider based on intersection across series
 # =========================
-year_min = max(s["Year"].min() for s in [co2_cn, co2_world, energy_cn, gdp_cn, temp_cn, disasters_cn])
-year_max = min(s["Year"].max() for s in [co2_cn, co2_world, energy_cn, gdp_cn, temp_cn, disasters_cn])
+@st.cache_data(hash_funcs=_HASH_FUNCS)
+def _year_bounds(*series: pd.DataFrame) -> tuple:
+    """Intersection of the Year ranges across all loaded series (cached so
+    slider reruns don't re-scan five frames)."""
+    return (int(max(s["Year"].min() for s in series)),
+            int(min(s["Year"].max() for s in series)))
+
+year_min, year_max = _year_bounds(co2_cn, co2_world, energy_cn, gdp_cn, temp_cn, disasters_cn)
 
 st.sidebar.header("Controls")
-default_start = max(int(year_min), 1980)  # modern default if possible
-yr0, yr1 = st.sidebar.slider("Year range", int(year_min), int(year_max), (default_start, int(year_max)), step=1)
+default_start = max(year_min, 1980)  # modern default if possible
+yr0, yr1 = st.sidebar.slider("Year range", year_min, year_max, (default_start, year_max), step=1)
 
 def window(df):
-    return df[(df["Year"] >= yr0) & (df["Year"] <= yr1)].copy()
+    # every series is Year-sorted by its loader, so the slider window is a
+    # binary search + positional slice rather than a full boolean scan
+    y = df["Year"].to_numpy()
+    lo = np.searchsorted(y, yr0, side="left")
+    hi = np.searchsorted(y, yr1, side="right")
+    # no .copy(): downstream only reads these slices (charts, joins), so the
+    # iloc view is enough — nothing to memcpy five times per rerun
+    return df.iloc[lo:hi]
 
 co2_cn_w    = window(co2_cn)
-co2_world_w = window(co2_world)
 energy_cn_w = window(energy_cn)
 gdp_cn_w    = window(gdp_cn)
 temp_cn_w   = window(temp_cn)
 dis_cn_w    = window(disasters_cn)
 
-# Small helper to format y-axis & margins
-def fmt(fig, yfmt=None):
-    if yfmt:
-        fig.update_layout(yaxis=dict(tickformat=yfmt))
-    fig.update_layout(margin=dict(l=8, r=8, t=60, b=8))
-    return fig
+# Shared layout defaults, applied once at figure build time (inside the cached
+# builders) instead of via a per-rerun fmt() traversal
+DEFAULT_LAYOUT = dict(margin=dict(l=8, r=8, t=60, b=8))
+
+# Plotly figure builders, cached on their input frame: oscillating the slider
+# around the same window replays the finished figure spec instead of paying
+# the Plotly (and, for the scatter, statsmodels OLS) build again.
+@st.cache_data(show_spinner=False, hash_funcs=_HASH_FUNCS)
+def make_disasters_fig(dis: pd.DataFrame) -> dict:
+    fig = px.line(dis, x="Year", y="Disasters", markers=True,
+                  title="Natural Disasters — China")
+    fig.update_layout(**DEFAULT_LAYOUT)
+    return fig.to_dict()
+
+@st.cache_data(show_spinner=False, hash_funcs=_HASH_FUNCS)
+def make_analysis_fig(df_ct: pd.DataFrame, df_ratio: pd.DataFrame) -> dict:
+    # Both analysis charts live in one subplot figure: the frontend stands up a
+    # single Plotly.js instance (one DOM tree, one resize handler, one payload)
+    # instead of paying the per-chart init cost twice.
+    fig = make_subplots(rows=1, cols=2,
+                        subplot_titles=("CO₂ vs Temperature (Overlapping Years)",
+                                        "China’s Share of Global CO₂"))
+    # Left: graph_objects traces built straight from the ndarrays — no Plotly
+    # Express DataFrame pipeline, and Scattergl renders through WebGL.
+    # The trendline is a plain least-squares line; no statsmodels/patsy needed
+    # (trendline="ols" pulls both in)
+    x = df_ct["CO2_Mt"].to_numpy(dtype="float64")
+    y = df_ct["Temperature (°C)"].to_numpy(dtype="float64")
+    ok = ~(np.isnan(x) | np.isnan(y))
+    # closed-form slope/intercept: (x-x̄)·(y-ȳ)/‖x-x̄‖² — two dot products,
+    # no polyfit SVD machinery for a 2-parameter fit
+    xm, ym = x[ok].mean(), y[ok].mean()
+    xc = x[ok] - xm
+    m = float(xc @ (y[ok] - ym)) / float(xc @ xc)
+    b = ym - m * xm
+    xs = np.array([x[ok].min(), x[ok].max()])
+    # float32 is plenty at chart resolution and halves the JSON payload the
+    # frontend has to parse (the fit itself stays float64 above)
+    fig.add_trace(go.Scattergl(
+        x=x.astype(np.float32), y=y.astype(np.float32), mode="markers",
+        customdata=df_ct["Year"].to_numpy(),
+        hovertemplate="CO₂ (Mt)=%{x}<br>Temperature (°C)=%{y}<br>Year=%{customdata}<extra></extra>"),
+        row=1, col=1)
+    fig.add_trace(go.Scattergl(x=xs.astype(np.float32),
+                               y=(m * xs + b).astype(np.float32),
+                               mode="lines", name="OLS fit"),
+                  row=1, col=1)
+    # Right: China's share of the world total by year
+    fig.add_trace(go.Scatter(x=df_ratio["Year"].to_numpy(),
+                             y=df_ratio["China_%_World"].to_numpy(dtype="float32"),
+                             mode="lines+markers"),
+                  row=1, col=2)
+    fig.update_xaxes(title_text="CO₂ (Mt)", row=1, col=1)
+    fig.update_yaxes(title_text="Temperature (°C)", row=1, col=1)
+    fig.update_xaxes(title_text="Year", row=1, col=2)
+    fig.update_yaxes(title_text="China’s % of World CO₂", row=1, col=2)
+    fig.update_layout(showlegend=False, **DEFAULT_LAYOUT)
+    return fig.to_dict()
+
+# The joins and the correlation are pure functions of the windowed frames, so
+# cache them too — a rerun that lands on a previously seen window skips the
+# joins and the Pearson pass entirely.
+@st.cache_data(show_spinner=False, hash_funcs=_HASH_FUNCS)
+def _merge_ct(co2_w: pd.DataFrame, temp_w: pd.DataFrame) -> pd.DataFrame:
+    # year_join clips both sides to the overlapping year range before the
+    # index-aligned join, so the long CO₂ series never feeds unmatched rows in
+    return (year_join(co2_w.rename(columns={"CO₂ (Mt)": "CO2_Mt"}), temp_w)
+            .dropna().reset_index(drop=True))
+
+@st.cache_data(show_spinner=False, hash_funcs=_HASH_FUNCS)
+def _merge_ratio(co2_w: pd.DataFrame) -> pd.DataFrame:
+    # no DataFrame join at all: divide the windowed China series by the cached
+    # world lookup Series — index intersection does the alignment, and years
+    # outside the window (or with no world total) fall out with dropna
+    w = world_co2_by_year(CO2_XLSX)
+    share = (co2_w.set_index("Year")["CO₂ (Mt)"].astype("float64")
+             .div(w).dropna().mul(100.0).rename("China_%_World"))
+    return share.reset_index()
+
+@st.cache_data(show_spinner=False, hash_funcs=_HASH_FUNCS)
+def _pearson_ct(df_ct: pd.DataFrame):
+    x = df_ct["CO2_Mt"].to_numpy(dtype="float64")
+    y = df_ct["Temperature (°C)"].to_numpy(dtype="float64")
+    # with ≥2 non-NaN rows guaranteed by the caller, the only way pearson can
+    # fail is a flat series putting zero in its denominator — check that
+    # precondition explicitly instead of catching the fallout downstream
+    if np.var(x) == 0.0 or np.var(y) == 0.0:
+        return None
+    return pearson(x, y)
 
 # =========================
-# Row 1: CO₂ & Temperature
+# Rows 1–2: CO₂, Temperature, Energy & GDP. These are plain single-series
+# lines, so use st.line_chart (Streamlit's built-in Vega-Lite renderer):
+# no Plotly figure build, layout pass, or JSON serialization per rerun.
 # =========================
 c1, c2 = st.columns(2)
 with c1:
     st.subheader("China CO₂ Emissions (Mt)")
-    fig = px.line(co2_cn_w, x="Year", y="CO₂ (Mt)", markers=True,
-                  labels={"CO₂ (Mt)":"CO₂ (million tonnes)"},
-                  title="Annual CO₂ Emissions — China")
-    st.plotly_chart(fmt(fig, yfmt="~s"), use_container_width=True)
+    st.line_chart(co2_cn_w.set_index("Year")["CO₂ (Mt)"], height=300)
     st.caption("CO₂ converted from '1000 tonnes' to **million tonnes (Mt)**. Rapid growth is visible in recent decades.")
 
 with c2:
     st.subheader("China Temperature (Annual Mean, °C)")
-    fig = px.line(temp_cn_w, x="Year", y="Temperature (°C)", markers=True,
-                  title="Annual Mean Temperature — China")
-    st.plotly_chart(fmt(fig, yfmt=".2f"), use_container_width=True)
+    st.line_chart(temp_cn_w.set_index("Year")["Temperature (°C)"], height=300)
     st.caption("Annual national mean created from monthly city data → annual city means → national average.")
 
-# =========================
-# Row 2: Energy & GDP
-# =========================
 c3, c4 = st.columns(2)
 with c3:
     st.subheader("Energy Use per Person (kg oil-eq./capita)")
-    fig = px.line(energy_cn_w, x="Year", y="Energy (kg oil-eq./capita)", markers=True,
-                  title="Energy Use per Person — China")
-    st.plotly_chart(fmt(fig), use_container_width=True)
+    st.line_chart(energy_cn_w.set_index("Year")["Energy (kg oil-eq./capita)"], height=300)
     st.caption("Higher energy use per person generally aligns with industrialization and rising emissions.")
 
 with c4:
     st.subheader("GDP per Capita Growth (%)")
-    fig = px.line(gdp_cn_w, x="Year", y="GDP Growth (%)", markers=True,
-                  title="GDP per Capita Growth — China")
-    st.plotly_chart(fmt(fig, yfmt=".1f"), use_container_width=True)
+    st.line_chart(gdp_cn_w.set_index("Year")["GDP Growth (%)"], height=300)
     st.caption("GDP per capita growth (%) provides economic context for changes in energy use and emissions.")
 
 # =========================
@@ -245,9 +206,7 @@ with c4:
 # =========================
 st.subheader("Natural Disasters — China (Yearly Counts)")
 if not dis_cn_w.empty:
-    fig = px.line(dis_cn_w, x="Year", y="Disasters", markers=True,
-                  title="Natural Disasters — China")
-    st.plotly_chart(fmt(fig), use_container_width=True)
+    st.plotly_chart(make_disasters_fig(dis_cn_w), use_container_width=True)
     st.caption(
         "Yearly count of recorded natural disasters. This is **descriptive**; it does not prove causation, "
         "but it helps contextualize climate-related impacts over time."
@@ -256,47 +215,35 @@ else:
     st.info("No disaster records in the selected year window. Try widening the slider.")
 
 # =========================
-# Row 4: CO₂ vs Temperature (scatter + trendline) + correlation
+# Row 4: CO₂ vs Temperature (scatter + trendline + correlation) alongside
+# China’s share of the global total, as one two-panel Plotly figure.
+# The analysis panel is an st.fragment: widget events inside it rerun only
+# the fragment, not the whole script (the sidebar slider stays global).
 # =========================
-st.subheader("Relationship: CO₂ vs Temperature (China)")
-df_ct = pd.merge(
-    co2_cn_w.rename(columns={"CO₂ (Mt)":"CO2_Mt"}),
-    temp_cn_w, on="Year", how="inner"
-)
-if not df_ct.empty and df_ct["CO2_Mt"].notna().sum() > 1:
-    fig = px.scatter(
-        df_ct, x="CO2_Mt", y="Temperature (°C)",
-        trendline="ols", hover_data=["Year"],
-        labels={"CO2_Mt":"CO₂ (Mt)", "Temperature (°C)":"Temperature (°C)"},
-        title="CO₂ vs Temperature — China (Overlapping Years)"
-    )
-    st.plotly_chart(fmt(fig), use_container_width=True)
-    try:
-        r, p = pearsonr(df_ct["CO2_Mt"], df_ct["Temperature (°C)"])
-        st.caption(f"Pearson **r = {r:.3f}**, **p = {p:.3g}** over **{len(df_ct)}** overlapping years (descriptive association).")
-    except Exception:
-        st.caption("Correlation unavailable (scipy/statsmodels issue).")
-else:
-    st.info("No overlapping years between CO₂ and Temperature in this selection. Widen the year range.")
-
-# =========================
-# Row 5: Extra Credit — China’s CO₂ as % of Global Total
-# =========================
-st.subheader("Extra Credit: China’s CO₂ as % of Global Total")
-df_ratio = pd.merge(
-    co2_cn_w.rename(columns={"CO₂ (Mt)":"CO2_Mt"}),
-    co2_world_w, on="Year", how="inner"
-)
-world_col = "CO₂_World (Mt)"
-if not df_ratio.empty and world_col in df_ratio.columns:
-    df_ratio["China_%_World"] = (df_ratio["CO2_Mt"] / df_ratio[world_col]) * 100.0
-    fig = px.line(df_ratio, x="Year", y="China_%_World", markers=True,
-                  labels={"China_%_World":"China’s % of World CO₂"},
-                  title="China’s Share of Global CO₂")
-    st.plotly_chart(fmt(fig), use_container_width=True)
-    st.caption("This ratio controls for global totals and shows how China’s **share** of world emissions changes over time.")
-else:
-    st.info("World CO₂ total not available for overlap. Check CO₂ files or widen the year range.")
+@st.fragment
+def _analysis_panel(co2_w, temp_w):
+    st.subheader("Analysis: CO₂ vs Temperature & Share of Global CO₂ (China)")
+    with st.expander("Show CO₂/temperature and global-share analysis", expanded=False):
+        df_ct = _merge_ct(co2_w, temp_w)
+        df_ratio = _merge_ratio(co2_w)
+        # _merge_ct already dropna'd the joined columns, so the row count alone is
+        # the "≥2 usable pairs" guard — computed once and reused in the caption
+        n = len(df_ct.index)
+        if n > 1 and not df_ratio.empty:
+            st.plotly_chart(make_analysis_fig(df_ct, df_ratio), use_container_width=True)
+            rp = _pearson_ct(df_ct)
+            if rp is None:
+                st.caption("Correlation undefined (zero variance).")
+            else:
+                r, p = rp
+                st.caption(f"Pearson **r = {r:.3f}**, **p = {p:.3g}** over **{n}** overlapping years (descriptive association).")
+            st.caption("The share panel controls for global totals and shows how China’s **share** of world emissions changes over time.")
+        elif n <= 1:
+            st.info("No overlapping years between CO₂ and Temperature in this selection. Widen the year range.")
+        else:
+            st.info("World CO₂ total not available for overlap. Check CO₂ files or widen the year range.")
+
+_analysis_panel(co2_cn_w, temp_cn_w)
 
 # =========================
 # Footer notes
@@ -0,0 +1,294 @@
+"""
+Shared data layer for the dashboards: Excel/CSV → tidy China series.
+
+Everything cache-worthy lives here so every dashboard that does
+`from data import load_co2, ...` shares one `st.cache_data` entry per
+loader (Streamlit keys its cache on the function's qualified name).
+"""
+import re
+from math import erfc, sqrt
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import streamlit as st
+import pandas as pd
+
+COUNTRY = "China"  # fixed per the group project
+
+# Explicit Excel read options: year columns land as float32 (no inference pass),
+# World Bank-style placeholders become NaN, and only Country + year columns are
+# read at all (metadata columns never cross the pandas boundary).
+_EXCEL_NA = ["..", "N/A", ""]
+
+# Year headers 1700–2100, tolerant to Excel's '1960.0' float-ification.
+_YEAR_RE = re.compile(r"^(1[789]\d{2}|20\d{2}|2100)(?:\.0+)?$")
+
+def _excel_usecols(c) -> bool:
+    s = str(c).strip()
+    return s.lower() in ("country", "country name", "nation") or s.replace(".0", "").isdigit()
+
+def _read_excel_wide(path: str) -> pd.DataFrame:
+    # dtype keys must match the sheet's actual headers — pandas treats int
+    # keys that aren't column labels as positional indices, and these sheets
+    # label year columns with ints. Read the header row alone first and map
+    # exactly the year columns it contains to float32.
+    header = pd.read_excel(path, engine="openpyxl", nrows=0, usecols=_excel_usecols)
+    dtypes = {c: "float32" for c in header.columns if _YEAR_RE.match(str(c).strip())}
+    return pd.read_excel(path, engine="openpyxl", dtype=dtypes,
+                         na_values=_EXCEL_NA, usecols=_excel_usecols)
+
+def _melt_years(df: pd.DataFrame, id_col: str, value_name: str) -> pd.DataFrame:
+    """
+    Robust wide→long reshape:
+    - normalizes headers to strings
+    - detects year columns (1700–2100), tolerant to '1960.0'
+    - returns [id_col, Year, value_name]
+    """
+    df = df.copy()
+    df.columns = [str(c).strip() for c in df.columns]
+
+    # ensure ID column exists; fallbacks if needed
+    if id_col not in df.columns:
+        candidates = [c for c in df.columns if c.lower() in ("country", "country name", "nation")]
+        id_col = candidates[0] if candidates else df.columns[0]
+
+    # headers are already stripped strings, so one regex match per column
+    # replaces the old int(float(...)) try/except per header
+    year_cols = [c for c in df.columns if _YEAR_RE.match(c)]
+    if not year_cols:
+        st.error("Could not detect year columns in the file below. Inspect headers:")
+        st.write(df.head())
+        st.stop()
+
+    # reshape via one ravel instead of pd.melt: melt repeats the id column and
+    # allocates object intermediates; here the long frame is three flat arrays
+    wide = df.set_index(id_col)[year_cols]
+    years = np.array([int(float(c)) for c in year_cols], dtype=np.int64)
+    out = pd.DataFrame({
+        id_col: np.repeat(wide.index.to_numpy(), len(years)),
+        "Year": np.tile(years, len(wide)),
+        value_name: wide.to_numpy(dtype="float32", copy=False).ravel(order="C"),
+    })
+    return out.sort_values("Year", kind="stable", ignore_index=True)
+
+_COUNTRY_KEY = COUNTRY.casefold()  # normalized once, reused by every lookup
+
+def _country_key(s: pd.Series) -> pd.Series:
+    """Casefold-normalized country names (one pass per frame)."""
+    return s.astype(str).str.strip().str.casefold()
+
+def _country_filter(df: pd.DataFrame, country_col: str, country_name: str) -> pd.DataFrame:
+    return df[_country_key(df[country_col]).eq(country_name.casefold())]
+
+def _extract_country(df: pd.DataFrame, cols) -> pd.DataFrame:
+    """Slice the project country's rows and `cols` via the normalized key."""
+    return df.loc[_country_key(df["Country"]).eq(_COUNTRY_KEY), cols].reset_index(drop=True)
+
+def pearson(x: np.ndarray, y: np.ndarray) -> tuple:
+    """
+    Pearson r with a normal-approximation p-value. A few NumPy reductions on
+    arrays this size beat importing scipy.stats (and its BLAS init) for one call.
+    """
+    xc = x - x.mean()
+    yc = y - y.mean()
+    # mean-centered dot products: three BLAS-level reductions, no temporaries
+    # beyond the centered arrays
+    r = float(xc @ yc / np.sqrt((xc @ xc) * (yc @ yc)))
+    n = len(x)
+    t = abs(r) * sqrt((n - 2) / max(1e-300, 1.0 - r * r))
+    p = erfc(t / sqrt(2.0))  # two-sided, normal approximation to the t-distribution
+    return r, p
+
+def year_join(a: pd.DataFrame, b: pd.DataFrame, how: str = "inner") -> pd.DataFrame:
+    """
+    Join two Year-sorted frames on Year. Setting Year as the index lets
+    pandas align on the monotonic index intersection instead of building
+    merge's hash tables; both inputs come from loaders that sort by Year.
+
+    For inner joins both sides are first clipped to the overlapping year
+    range, so a long series (China CO₂ starts in the 1800s) never feeds
+    rows into the join that the shorter side can't match anyway.
+    """
+    if how == "inner" and len(a) and len(b):
+        ya, yb = a["Year"].to_numpy(), b["Year"].to_numpy()
+        y0, y1 = max(ya[0], yb[0]), min(ya[-1], yb[-1])
+        a = a.iloc[np.searchsorted(ya, y0, "left"):np.searchsorted(ya, y1, "right")]
+        b = b.iloc[np.searchsorted(yb, y0, "left"):np.searchsorted(yb, y1, "right")]
+    return a.set_index("Year").join(b.set_index("Year"), how=how).reset_index()
+
+def _to_arrow(df: pd.DataFrame) -> pd.DataFrame:
+    """Arrow-backed dtypes: Year → int16[pyarrow], float values → float32[pyarrow]."""
+    casts = {}
+    for c in df.columns:
+        if c == "Year":
+            casts[c] = "int16[pyarrow]"
+        elif pd.api.types.is_float_dtype(df[c]):
+            casts[c] = "float32[pyarrow]"
+    return df.astype(casts)
+
+def _cached_tidy(path: str, builder) -> pd.DataFrame:
+    """
+    Parquet sidecar cache for the slow Excel→tidy conversions:
+    - if `<file>.parquet` exists next to the Excel and is at least as new, read that
+    - else run `builder(path)` once (the Excel parse + melt) and persist the result
+    Keeps cold starts at Parquet speed instead of openpyxl XML-parsing speed.
+    Frames come back Arrow-backed either way (half-width Year/value buffers).
+    """
+    cache = Path(path).with_suffix(".parquet")
+    if cache.exists() and cache.stat().st_mtime >= Path(path).stat().st_mtime:
+        return pd.read_parquet(cache, engine="pyarrow", dtype_backend="pyarrow")
+    df = _to_arrow(builder(path))
+    df.to_parquet(cache, engine="pyarrow", compression="zstd", index=False)
+    return df
+
+def _build_co2(path: str) -> pd.DataFrame:
+    """
+    Wide CO₂ (1000 tonnes) Excel → tidy [Year, CO₂ (Mt), CO₂_World (Mt)].
+    No melt here: the world total is one column reduction over the wide block
+    and the China series is a single row of it.
+    """
+    df = _read_excel_wide(path)
+    df = df.rename(columns={df.columns[0]: "Country"})
+    df.columns = [str(c).strip() for c in df.columns]
+    year_cols = [c for c in df.columns if _YEAR_RE.match(c)]
+    if not year_cols:
+        st.error("Could not detect year columns in the CO₂ file. Inspect headers:")
+        st.write(df.head())
+        st.stop()
+    world = df[year_cols].sum(axis=0, skipna=True).to_numpy(dtype="float64") / 1000.0
+    cn = _country_filter(df, "Country", COUNTRY)
+    china = (cn[year_cols].to_numpy(dtype="float64")[0] / 1000.0
+             if len(cn) else np.full(len(year_cols), np.nan))
+    years = np.array([int(float(c)) for c in year_cols], dtype=np.int64)
+    order = np.argsort(years, kind="stable")
+    return pd.DataFrame({"Year": years[order],
+                         "CO₂ (Mt)": china[order],
+                         "CO₂_World (Mt)": world[order]})
+
+def _build_energy(path: str) -> pd.DataFrame:
+    """Energy wide Excel → tidy [Country, Year, Energy (kg oil-eq./capita)]."""
+    df = _read_excel_wide(path)
+    if "country" in df.columns:
+        df = df.rename(columns={"country": "Country"})
+    else:
+        df = df.rename(columns={df.columns[0]: "Country"})
+    # keep only the China row before melting — no point replicating ~250
+    # countries of id_vars just to throw away all but one afterwards
+    df = _country_filter(df, "Country", COUNTRY)
+    return _melt_years(df, id_col="Country", value_name="Energy (kg oil-eq./capita)")
+
+def _build_gdp(path: str) -> pd.DataFrame:
+    """GDP per capita growth wide Excel → tidy [Country, Year, GDP Growth (%)]."""
+    df = _read_excel_wide(path)
+    if "Country Name" in df.columns:
+        df = df.rename(columns={"Country Name": "Country"})
+    else:
+        df = df.rename(columns={df.columns[0]: "Country"})
+    df = _country_filter(df, "Country", COUNTRY)  # filter before the melt, as above
+    return _melt_years(df, id_col="Country", value_name="GDP Growth (%)")
+
+@st.cache_data(persist="disk")
+def load_co2(path: str):
+    """
+    Load CO₂ via the Parquet sidecar cache → tidy:
+      co2_cn:  [Year, CO₂ (Mt)]
+      co2_world: [Year, CO₂_World (Mt)]
+    """
+    tidy = _cached_tidy(path, _build_co2)
+    co2_cn = tidy[["Year", "CO₂ (Mt)"]]
+    co2_world = tidy[["Year", "CO₂_World (Mt)"]]
+    return co2_cn, co2_world
+
+@st.cache_data(persist="disk")
+def load_energy(path: str):
+    """Energy wide Excel → tidy China series: [Year, Energy (kg oil-eq./capita)]"""
+    long = _cached_tidy(path, _build_energy)
+    return _extract_country(long, ["Year", "Energy (kg oil-eq./capita)"])
+
+@st.cache_data(persist="disk")
+def load_gdp(path: str):
+    """GDP per capita growth wide Excel → tidy China series: [Year, GDP Growth (%)]"""
+    long = _cached_tidy(path, _build_gdp)
+    return _extract_country(long, ["Year", "GDP Growth (%)"])
+
+@st.cache_data(persist="disk")
+def world_co2_by_year(path: str) -> pd.Series:
+    """World CO₂ totals (Mt) as a lookup Series indexed by int Year."""
+    tidy = _cached_tidy(path, _build_co2)
+    w = tidy.set_index("Year")["CO₂_World (Mt)"].astype("float64")
+    return w[w > 0]
+
+@st.cache_data(persist="disk")
+def load_temp(path: str):
+    """Temperature CSV → normalize to [Year, Temperature (°C)]"""
+    # Arrow's multi-threaded CSV reader with schema hints: lands straight in
+    # Arrow buffers with no pandas dtype-inference pass
+    tbl = pa_csv.read_csv(path, convert_options=pa_csv.ConvertOptions(
+        column_types={"Year": pa.int16(), "Temperature (°C)": pa.float32(),
+                      "Temp (°C)": pa.float32(), "Value": pa.float32()},
+        null_values=["", "NA", "NaN"]))
+    df = tbl.to_pandas(types_mapper=pd.ArrowDtype)
+    df.columns = [c.strip() for c in df.columns]
+    if "Temp (°C)" in df.columns and "Temperature (°C)" not in df.columns:
+        df = df.rename(columns={"Temp (°C)":"Temperature (°C)"})
+    if "Value" in df.columns and "Temperature (°C)" not in df.columns:
+        df = df.rename(columns={"Value":"Temperature (°C)"})
+    if "Year" not in df.columns or "Temperature (°C)" not in df.columns:
+        st.error("Temperature CSV must have 'Year' and 'Temperature (°C)' (or 'Value').")
+        st.write("Detected columns:", df.columns.tolist())
+        st.stop()
+    df["Year"] = pd.to_numeric(df["Year"], errors="coerce")
+    df = df.dropna(subset=["Year"]).astype({"Year": int}).sort_values("Year")
+    return _to_arrow(df[["Year", "Temperature (°C)"]])
+
+@st.cache_data(persist="disk")
+def load_disasters(path: str):
+    """
+    Natural disasters loader (robust):
+    - If tidy: expects [Year, Disasters]
+    - If raw EM-DAT-like: expects ['Start Year','Country', 'Disaster Type', ...] and groups to yearly counts
+    Returns China series: [Year, Disasters]
+    """
+    df = pd.read_excel(path)
+    df.columns = [str(c).strip() for c in df.columns]
+
+    # Tidy case
+    if "Year" in df.columns and ("Disasters" in df.columns or "Disaster Count" in df.columns):
+        if "Disaster Count" in df.columns and "Disasters" not in df.columns:
+            df = df.rename(columns={"Disaster Count": "Disasters"})
+        out = df[["Year", "Disasters"]].copy()
+        out["Year"] = pd.to_numeric(out["Year"], errors="coerce").astype("Int64")
+        return out.dropna(subset=["Year"]).astype({"Year": int}).sort_values("Year")
+
+    # Raw EM-DAT-like case
+    # Expect 'Start Year' and 'Country'
+    year_col = None
+    for c in df.columns:
+        if c.lower().replace("_", " ") in ("start year", "year"):
+            year_col = c
+            break
+
+    if year_col is None:
+        st.error("Could not find a 'Year' or 'Start Year' column in natural_disasters.xlsx.")
+        st.write("Detected columns:", df.columns.tolist())
+        st.stop()
+
+    # Filter China, count rows per year
+    df = df.rename(columns={year_col: "Year"})
+    df["Year"] = pd.to_numeric(df["Year"], errors="coerce")
+    if "Country" in df.columns:
+        df = _country_filter(df.dropna(subset=["Year"]), "Country", COUNTRY)
+    else:
+        df = df.dropna(subset=["Year"])
+
+    # counting occurrences of bounded integers: bincount over the year
+    # offsets beats a hash groupby, and the output is year-sorted for free
+    years = df["Year"].to_numpy(dtype=np.int64)
+    if years.size == 0:
+        return pd.DataFrame({"Year": pd.Series(dtype=int), "Disasters": pd.Series(dtype=int)})
+    y0 = years.min()
+    counts = np.bincount(years - y0)
+    nz = counts.nonzero()[0]
+    return pd.DataFrame({"Year": nz + y0, "Disasters": counts[nz]})